@@ -1,29 +1,56 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Header, Request
-from fastapi.responses import JSONResponse, FileResponse, HTMLResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse, HTMLResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import os
+import io
+import json
+import hashlib
+import asyncio
+import logging
+import secrets
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-from pdf_parser import CASParser
-import shutil
-from typing import Optional
+from models import CASData
+from pdf_parser import CASParser, EXCEL_ENGINES
+from typing import List, Optional, Tuple
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# Keep parser debug output out of the request path unless explicitly enabled
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper())
+
 # Environment variables with defaults
 PORT = int(os.getenv("PORT", 8080))
 API_KEY = os.getenv("API_KEY")
 MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", 10))
 RATE_LIMIT_PER_MINUTE = int(os.getenv("RATE_LIMIT_PER_MINUTE", 60))
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "http://localhost:8080,http://localhost:3000").split(",")
+# Server worker processes started by gunicorn (start.sh); each one owns a parser pool
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 4))
+# Split the CPUs between the server workers' pools instead of giving each pool all of them
+PARSER_WORKERS = int(os.getenv("PARSER_WORKERS", max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)))
+PARSER_EXECUTOR = os.getenv("PARSER_EXECUTOR", "process").lower()
+PARSER_PAGE_WORKERS = int(os.getenv("PARSER_PAGE_WORKERS", 1))
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_TIMEOUT = float(os.getenv("REDIS_TIMEOUT", 0.5))
+TEXT_CACHE_TTL = int(os.getenv("TEXT_CACHE_TTL", 3600))
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", 3600))
+EXCEL_ENGINE = os.getenv("EXCEL_ENGINE", "openpyxl").lower()
 
 app = FastAPI(
     title="CAS Parser API",
     description="API for parsing CAMS and NSDL CAS PDFs",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Mount static files
@@ -41,9 +68,129 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Create temp directory
-TEMP_DIR = "temp_uploads"
-os.makedirs(TEMP_DIR, exist_ok=True)
+# Uploads are read in chunks of this size
+UPLOAD_CHUNK_SIZE = 1 << 20
+ALLOWED_CONTENT_TYPES = {"application/pdf", "application/x-pdf", "application/octet-stream"}
+
+class ExcelExportError(Exception):
+    """Raised by the worker pool when the parsed data cannot be written to Excel"""
+
+
+def _parse_blocking(pdf_bytes: Optional[bytearray], password: str, filename: str,
+                    page_texts: Optional[List[str]] = None) -> Tuple[CASData, Optional[List[str]]]:
+    """Parse a CAS PDF and return the parsed data and newly extracted page texts; runs in the worker pool"""
+    with CASParser(pdf_bytes, password, filename=filename, page_texts=page_texts,
+                   page_workers=PARSER_PAGE_WORKERS) as parser:
+        cas_data = parser.parse()
+    return cas_data, parser.page_texts if page_texts is None else None
+
+
+def _export_excel_blocking(pdf_bytes: Optional[bytearray], password: str, filename: str,
+                           page_texts: Optional[List[str]] = None) -> Tuple[bytes, Optional[List[str]]]:
+    """Parse a CAS PDF and return the xlsx file contents and newly extracted page texts; runs in the worker pool"""
+    with CASParser(pdf_bytes, password, filename=filename, page_texts=page_texts,
+                   page_workers=PARSER_PAGE_WORKERS) as parser:
+        parser.parse()
+    try:
+        buffer = io.BytesIO()
+        parser.to_excel(buffer, engine=EXCEL_ENGINE)
+        return buffer.getvalue(), parser.page_texts if page_texts is None else None
+    except Exception as e:
+        raise ExcelExportError(str(e)) from None
+
+
+def _cache_keys(pdf_bytes: bytearray, password: str, filename: str, output_format: str) -> Tuple[str, str]:
+    """Redis keys for the extracted text and the finished response of an upload"""
+    # BLAKE2 is faster than SHA-256 and collision resistance is not a concern here
+    digest = hashlib.blake2b(pdf_bytes, digest_size=16)
+    digest.update(b"\0" + password.encode())
+    text_key = f"castext:{digest.hexdigest()}"
+    # The CAS ID and generation time are read from the file name, so the result depends on it too
+    digest.update(b"\0" + filename.encode())
+    return text_key, f"casresult:{output_format}:{digest.hexdigest()}"
+
+
+async def _cache_get(key: str) -> Optional[bytes]:
+    if app.state.redis is None:
+        return None
+    try:
+        return await app.state.redis.get(key)
+    except RedisError:
+        return None
+
+
+async def _cache_set(key: Optional[str], value: bytes, ttl: int) -> None:
+    if app.state.redis is None:
+        return
+    try:
+        await app.state.redis.setex(key, ttl, value)
+    except RedisError:
+        pass
+
+
+async def _get_cached_text(key: str) -> Optional[List[str]]:
+    cached = await _cache_get(key)
+    return json.loads(cached) if cached else None
+
+
+async def _set_cached_text(key: Optional[str], page_texts: List[str]) -> None:
+    if app.state.redis is None:
+        return
+    await _cache_set(key, json.dumps(page_texts).encode(), TEXT_CACHE_TTL)
+
+
+def _excel_response(excel_bytes: bytes) -> StreamingResponse:
+    return StreamingResponse(
+        io.BytesIO(excel_bytes),
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers={"Content-Disposition": 'attachment; filename="cas_data.xlsx"'}
+    )
+
+
+def _parse_failed(e: Exception) -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail=f"Failed to parse PDF: {str(e)}. Please check if the password is correct and the file is a valid CAS PDF."
+    )
+
+
+def _new_executor() -> Executor:
+    if PARSER_EXECUTOR == "thread":
+        return ThreadPoolExecutor(max_workers=PARSER_WORKERS)
+    return ProcessPoolExecutor(max_workers=PARSER_WORKERS)
+
+
+def _parser_crashed(executor: Executor) -> HTTPException:
+    """Replace a process pool that lost a worker, e.g. to a MuPDF crash or an OOM kill"""
+    # A broken pool rejects all further work; concurrent requests may all see the same one
+    if app.state.executor is executor:
+        executor.shutdown(wait=False)
+        app.state.executor = _new_executor()
+    return HTTPException(
+        status_code=503,
+        detail="The PDF parser stopped unexpectedly while processing this file. Please try again."
+    )
+
+
+@app.on_event("startup")
+async def start_executor():
+    # PDF parsing is CPU bound; keep it off the event loop
+    if PARSER_EXECUTOR == "thread" and PARSER_PAGE_WORKERS > 1:
+        # Page workers would be forked from the multithreaded server process
+        raise RuntimeError("PARSER_PAGE_WORKERS > 1 requires PARSER_EXECUTOR=process")
+    app.state.executor = _new_executor()
+
+
+@app.on_event("startup")
+async def check_excel_engine():
+    # Fail at startup rather than with a 500 on every Excel request
+    if EXCEL_ENGINE not in EXCEL_ENGINES:
+        raise RuntimeError(f"EXCEL_ENGINE must be one of: {', '.join(EXCEL_ENGINES)}")
+
+
+@app.on_event("shutdown")
+async def stop_executor():
+    app.state.executor.shutdown(wait=False, cancel_futures=True)
 
 # Simple API key validation
 async def verify_api_key(x_api_key: Optional[str] = Header(None)):
@@ -52,22 +199,74 @@ async def verify_api_key(x_api_key: Optional[str] = Header(None)):
     return x_api_key
 
 # Rate limiting
-request_counts = {}
+# Per-process fallback: (minute, client_ip) -> count for the current and previous minute only
+request_counts = OrderedDict()
+
+# Sliding one-minute window per client, evaluated atomically in Redis.
+# KEYS[1] = client key, ARGV = now (ms), limit, unique member for this request
+RATE_LIMIT_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, ARGV[1] - 60000)
+local n = redis.call('ZCARD', KEYS[1])
+if n >= tonumber(ARGV[2]) then return 0 end
+redis.call('ZADD', KEYS[1], ARGV[1], ARGV[3])
+redis.call('EXPIRE', KEYS[1], 60)
+return 1
+"""
+
+@app.on_event("startup")
+async def start_redis():
+    app.state.redis = None
+    app.state.rate_limit_script = None
+    if REDIS_URL:
+        # redis-py waits forever by default; bound the wait so a stalled Redis
+        # raises RedisError and requests fall back instead of hanging
+        app.state.redis = aioredis.from_url(
+            REDIS_URL, socket_connect_timeout=REDIS_TIMEOUT, socket_timeout=REDIS_TIMEOUT
+        )
+        # register_script runs via EVALSHA and reloads the script if Redis lost it
+        app.state.rate_limit_script = app.state.redis.register_script(RATE_LIMIT_SCRIPT)
+
+@app.on_event("shutdown")
+async def stop_redis():
+    if app.state.redis is not None:
+        await app.state.redis.close()
 
 async def check_rate_limit(request: Request):
     if not RATE_LIMIT_PER_MINUTE:
         return
         
     client_ip = request.client.host
-    current_minute = datetime.now().strftime("%Y-%m-%d %H:%M")
     
-    key = f"{client_ip}:{current_minute}"
-    count = request_counts.get(key, 0)
+    if app.state.rate_limit_script is not None:
+        now_ms = int(time.time() * 1000)
+        try:
+            allowed = await app.state.rate_limit_script(
+                keys=[f"rl:{client_ip}"],
+                args=[now_ms, RATE_LIMIT_PER_MINUTE, f"{now_ms}:{secrets.token_hex(8)}"]
+            )
+        except RedisError:
+            # Fall back to the per-process counter while Redis is unavailable
+            allowed = None
+        if allowed is not None:
+            if not allowed:
+                raise HTTPException(status_code=429, detail="Rate limit exceeded")
+            return
+    
+    now = time.time()
+    current_minute = int(now // 60)
+    
+    # Keys are inserted in minute order; evict everything before the previous minute
+    while request_counts and next(iter(request_counts))[0] < current_minute - 1:
+        request_counts.popitem(last=False)
     
-    if count >= RATE_LIMIT_PER_MINUTE:
+    count = request_counts.get((current_minute, client_ip), 0)
+    previous = request_counts.get((current_minute - 1, client_ip), 0)
+    
+    # Weight the previous minute by how much of it still overlaps the window
+    if count + previous * (1 - (now % 60) / 60) >= RATE_LIMIT_PER_MINUTE:
         raise HTTPException(status_code=429, detail="Rate limit exceeded")
         
-    request_counts[key] = count + 1
+    request_counts[(current_minute, client_ip)] = count + 1
 
 @app.post("/parse/cas")
 async def parse_cas(
@@ -86,78 +285,90 @@ async def parse_cas(
     # Check rate limit
     await check_rate_limit(request)
     
-    temp_path = None
     try:
         # Validate file
         if not file.filename.lower().endswith('.pdf'):
             raise HTTPException(status_code=400, detail="Only PDF files are supported")
             
+        if file.content_type and file.content_type not in ALLOWED_CONTENT_TYPES:
+            raise HTTPException(status_code=400, detail="Only PDF files are supported")
+            
         # Validate output format
         if output_format.lower() not in ['json', 'excel']:
             raise HTTPException(status_code=400, detail="Output format must be 'json' or 'excel'")
             
-        # Validate file size
-        file_content = await file.read()
-        if len(file_content) > MAX_FILE_SIZE_MB * 1024 * 1024:
-            raise HTTPException(status_code=400, detail=f"File size must be less than {MAX_FILE_SIZE_MB}MB")
-            
-        # Save uploaded file temporarily
-        temp_path = os.path.join(TEMP_DIR, f"{datetime.now().timestamp()}_{file.filename}")
-        with open(temp_path, "wb") as buffer:
-            buffer.write(file_content)
+        # Read the upload in chunks, validating size as it arrives; growing one
+        # buffer in place never holds a second full copy of the file
+        pdf_bytes = bytearray()
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            if len(pdf_bytes) + len(chunk) > MAX_FILE_SIZE_MB * 1024 * 1024:
+                raise HTTPException(status_code=400, detail=f"File size must be less than {MAX_FILE_SIZE_MB}MB")
+            pdf_bytes += chunk
         
-        try:
-            # Parse the CAS PDF
-            parser = CASParser(temp_path, password)
-            cas_data = parser.parse()
-        except Exception as e:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Failed to parse PDF: {str(e)}. Please check if the password is correct and the file is a valid CAS PDF."
-            )
+        # The client-supplied name is only used to read CAMS metadata; never as a path
+        filename = os.path.basename(file.filename)
+        
+        # Repeat uploads of the same file return the earlier response, or at least reuse its text
+        # Hashing the whole upload is only worth it with a cache to look in
+        cached_text = text_key = result_key = None
+        if app.state.redis is not None:
+            text_key, result_key = _cache_keys(pdf_bytes, password, filename, output_format.lower())
+            cached_result = await _cache_get(result_key)
+            if cached_result is not None:
+                if output_format.lower() == 'json':
+                    return Response(cached_result, media_type="application/json")
+                return _excel_response(cached_result)
+            
+            cached_text = await _get_cached_text(text_key)
+            if cached_text is not None:
+                pdf_bytes = None
         
+        loop = asyncio.get_running_loop()
+        executor = app.state.executor
         if output_format.lower() == 'json':
-            # Return JSON response
-            result = {
-                "meta": cas_data.meta.__dict__,
-                "investor_info": cas_data.investor_info.__dict__,
-                "mutual_funds": [mf.__dict__ for mf in cas_data.mutual_funds],
-                "portfolio_summary": cas_data.portfolio_summary.__dict__
-            }
+            try:
+                # Parse the CAS PDF in the worker pool
+                result, page_texts = await loop.run_in_executor(
+                    executor, _parse_blocking, pdf_bytes, password, filename, cached_text
+                )
+            except BrokenProcessPool:
+                raise _parser_crashed(executor)
+            except Exception as e:
+                raise _parse_failed(e)
             
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-            return JSONResponse(content=result)
+            if page_texts is not None:
+                await _set_cached_text(text_key, page_texts)
+            # orjson serialises the dataclass tree and datetimes natively
+            response = ORJSONResponse(result)
+            await _cache_set(result_key, response.body, RESULT_CACHE_TTL)
+            return response
         else:
-            # Return Excel file
-            excel_path = os.path.join(TEMP_DIR, f"{datetime.now().timestamp()}_output.xlsx")
+            # Return Excel file, built in memory so nothing is left on disk
             try:
-                parser.to_excel(excel_path)
-            except Exception as e:
+                excel_bytes, page_texts = await loop.run_in_executor(
+                    executor, _export_excel_blocking, pdf_bytes, password, filename, cached_text
+                )
+            except BrokenProcessPool:
+                raise _parser_crashed(executor)
+            except ExcelExportError as e:
                 raise HTTPException(
                     status_code=500,
                     detail=f"Failed to generate Excel file: {str(e)}"
                 )
+            except Exception as e:
+                raise _parse_failed(e)
+            
+            if page_texts is not None:
+                await _set_cached_text(text_key, page_texts)
+            await _cache_set(result_key, excel_bytes, RESULT_CACHE_TTL)
                 
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-                
-            response = FileResponse(
-                excel_path,
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                filename="cas_data.xlsx"
-            )
-            return response
+            return _excel_response(excel_bytes)
             
     except HTTPException as he:
         # Re-raise HTTP exceptions
-        if temp_path and os.path.exists(temp_path):
-            os.remove(temp_path)
         raise he
     except Exception as e:
         # Handle unexpected errors
-        if temp_path and os.path.exists(temp_path):
-            os.remove(temp_path)
         raise HTTPException(
             status_code=500,
             detail=f"An unexpected error occurred: {str(e)}"
@@ -1,35 +1,75 @@
 from dataclasses import dataclass, field
-from typing import List, Dict, Any
+from datetime import datetime
+from typing import List, Optional
 
-@dataclass
+@dataclass(slots=True)
 class Meta:
     statement_period: str = ""
+    # ISO dates of the statement period
+    period_from: str = ""
+    period_to: str = ""
     cas_type: str = ""
 
-@dataclass
+@dataclass(slots=True)
 class InvestorInfo:
     name: str = ""
     email: str = ""
     mobile: str = ""
     pan: str = ""
-    address: List[str] = field(default_factory=list)
+    address: str = ""
+    cas_id: str = ""
 
-@dataclass
-class MutualFund:
-    folio: str
-    scheme: str
+@dataclass(slots=True)
+class Gain:
+    absolute: float = 0.0
+    percentage: float = 0.0
+
+@dataclass(slots=True)
+class AdditionalInfo:
+    advisor: Optional[str] = None
+    rta: Optional[str] = None
+    rta_code: Optional[str] = None
+
+@dataclass(slots=True)
+class MutualFundScheme:
+    folio_number: Optional[str]
+    amc: Optional[str]
+    name: str
     isin: str
-    transactions: List[Dict[str, Any]] = field(default_factory=list)
-    current_value: float = 0.0
+    units: float = 0.0
+    nav: float = 0.0
+    value: float = 0.0
+    cost: float = 0.0
+    gain: Gain = field(default_factory=Gain)
+    additional_info: AdditionalInfo = field(default_factory=AdditionalInfo)
+
+@dataclass(slots=True)
+class Transaction:
+    folio_number: Optional[str]
+    amc: Optional[str]
+    scheme_name: str
+    date: datetime
+    description: str
+    amount: float
+    units: float
+    nav: float
+    type: str = ""
+    dividend_rate: Optional[float] = None
+
+@dataclass(slots=True)
+class MutualFundSummary:
+    count: float = 0.0
+    total_value: float = 0.0
 
-@dataclass
+@dataclass(slots=True)
 class PortfolioSummary:
     total_value: float = 0.0
-    mutual_funds: Dict[str, Any] = field(default_factory=dict)
+    mutual_funds: MutualFundSummary = field(default_factory=MutualFundSummary)
 
-@dataclass
+@dataclass(slots=True)
 class CASData:
     meta: Meta = field(default_factory=Meta)
     investor_info: InvestorInfo = field(default_factory=InvestorInfo)
-    mutual_funds: List[MutualFund] = field(default_factory=list)
     portfolio_summary: PortfolioSummary = field(default_factory=PortfolioSummary)
+    schemes: List[MutualFundScheme] = field(default_factory=list)
+    transactions: List[Transaction] = field(default_factory=list)
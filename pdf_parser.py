@@ -1,53 +1,255 @@
-import pdfplumber
+import fitz
 import json
+import logging
+import os
 import re
-import pandas as pd
+import openpyxl
+import xlsxwriter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from dataclasses import asdict
 from datetime import datetime
-from typing import Dict, Any, List, Optional
-from models import CASData, InvestorInfo, PortfolioSummary, MutualFundScheme, Transaction, AdditionalInfo, Gain
-from PyPDF2 import PdfReader
+from typing import Dict, Any, Iterable, List, Optional, Tuple, Union, BinaryIO
+from models import CASData, Meta, InvestorInfo, PortfolioSummary, MutualFundScheme, Transaction, AdditionalInfo, Gain
+import xlsx_writer
+
+logger = logging.getLogger(__name__)
+
+# Any one of these identifies a CAMS statement
+_CAMS_MARKER_RE = re.compile(
+    r"CAMS - Consolidated Account Statement"
+    r"|Computer Age Management Services Limited"
+    r"|CAMS Financial Information Services"
+)
+
+# Investor details
+_INVESTOR_META_RE = re.compile(
+    r"(?P<pan>PAN:\s*(?P<pan_no>[A-Z]{5}\d{4}[A-Z])?)"
+    r"|(?P<email>\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b)"
+    r"|(?P<mobile>Mobile:\s*(?P<mobile_no>\+?\d[\d\s-]{8,}\d))"
+    r"|(?P<period>Statement for the period from (?P<period_from>\d{2}-[A-Za-z]{3}-\d{4})"
+    r" to (?P<period_to>\d{2}-[A-Za-z]{3}-\d{4}))"
+)
+_NAME_RE = re.compile(r"^([^\n]+)\s+PAN:", re.MULTILINE)
+_ADDRESS_ISIN_RE = re.compile(r"\s*-\s*ISIN:.*$")
+_ADDRESS_GROWTH_RE = re.compile(r"\s*-\s*Growth.*$")
+# Lines following the investor name, up to the first folio
+_ADDRESS_BLOCK_RE = re.compile(r"((?:(?![^\S\n]*Folio No:)[^\n]*(?:\n|$))*)")
+_ADDRESS_SKIP_RE = re.compile(r"^[^\S\n]*(?:\*\*\*|Opening Unit)[^\n]*$", re.MULTILINE)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Statement metadata; CAS ID and generation time come from the CAMS file name
+_CAS_ID_RE = re.compile(r"CP(\d+)_")
+_GENERATED_RE = re.compile(r"_(\d{14}\d*)\.")
+
+# Closing balance and transaction details
+# e.g. "Closing Unit Balance: 189.946 NAV on 20-Jun-2025: INR 145.3397
+#       Total Cost Value: 25,000.00 Market Value on 20-Jun-2025: INR 27,606.05"
+_BALANCE_FIELD_RE = re.compile(
+    r"(?P<label>Closing Unit Balance|NAV|Cost(?: Value)?|Value|Valuation)[^:\n]*:\s*"
+    r"(?:Rs\.|INR)?\s*(?P<amount>[\d,]+\.?\d*)"
+)
+_DIVIDEND_RE = re.compile(r"@\s*Rs\.\s*(\d*\.?\d+)")
+# Transaction line: date, description, then amount, units and NAV columns
+_TXN_RE = re.compile(
+    r"(?P<date>\d{2}-[A-Za-z]{3}-\d{4})\s+(?P<desc>\S.*?)"
+    r"\s+(?P<amount>-?\d[\d,]*(?:\.\d*)?)\s+(?P<units>-?\d[\d,]*(?:\.\d*)?)\s+(?P<nav>-?\d[\d,]*(?:\.\d*)?)"
+)
+
+# Non-empty lines, for walking a page without materialising split('\n')
+_LINE_RE = re.compile(r"[^\n]+")
+
+# Single-pass scanner for the mutual fund section; dispatch on ``lastgroup``
+_MASTER_RE = re.compile(
+    r"(?P<folio>Folio No:[^\S\n]*(?P<folio_no>[\w \t/-]+))"
+    r"|(?P<arn>ARN-\d+)"
+    r"|(?P<isin>ISIN:[^\S\n]*(?P<isin_code>INF\w+))"
+    r"|(?P<rta>CAMS|KFINTECH)"
+    r"|^[^\S\n]*(?P<txn>\d{2}-[A-Za-z]{3}-\d{4}[^\n]*)"
+    r"|(?P<bal>Closing Unit Balance:[^\n]*)",
+    re.MULTILINE,
+)
+
+
+# _parse_mutual_funds_into_state scan states
+_SEEKING_SCHEME = 'seeking_scheme'
+_IN_SCHEME = 'in_scheme'
+
+_MONTHS = {month: i for i, month in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], 1)}
+
+
+def _parse_date(value: str) -> datetime:
+    """Parse a DD-Mon-YYYY date without going through strptime"""
+    day, month, year = value.split('-')
+    try:
+        return datetime(int(year), _MONTHS[month.lower()], int(day))
+    except KeyError:
+        raise ValueError(f"Invalid month in date: {value}") from None
+
+
+def _following_lines(text: str, pos: int, count: int):
+    """Yield up to `count` lines after the line containing `pos`"""
+    start = text.find('\n', pos)
+    while count and start != -1:
+        end = text.find('\n', start + 1)
+        yield text[start + 1:end if end != -1 else len(text)]
+        start = end
+        count -= 1
+
+# Statements shorter than this are extracted in-process even when page workers are enabled
+_PARALLEL_MIN_PAGES = 32
+
+def _extract_page_range(source: Union[str, bytes], password: str, start: int, stop: int) -> List[str]:
+    """Return the text of pages [start, stop); runs in a page worker process"""
+    doc = fitz.open(source) if isinstance(source, str) else fitz.open(stream=source, filetype="pdf")
+    try:
+        if doc.needs_pass:
+            doc.authenticate(password)
+        return [doc[page_num].get_text("text") for page_num in range(start, stop)]
+    finally:
+        doc.close()
+
+# Sheets are passed around as (title, header, rows) with rows produced lazily
+ExcelSheet = Tuple[str, List[str], Iterable[tuple]]
+
+def _save_openpyxl(output: Union[str, BinaryIO], sheets: Iterable[ExcelSheet]) -> None:
+    # Write-only workbooks stream rows out instead of keeping every cell in memory
+    wb = openpyxl.Workbook(write_only=True)
+    for title, header, rows in sheets:
+        # Each sheet is written in one sequential pass over its row iterable, with no intermediate list or DataFrame
+        ws = wb.create_sheet(title)
+        ws.append(header)
+        for row in rows:
+            ws.append(row)
+    wb.save(output)
+
+def _save_xlsxwriter(output: Union[str, BinaryIO], sheets: Iterable[ExcelSheet]) -> None:
+    # constant_memory flushes each row once the next one starts, so only one row is held at a time;
+    # that requires writing strictly in row order, which the sheet generators do
+    wb = xlsxwriter.Workbook(output, {'constant_memory': True,
+                                      'default_date_format': 'yyyy-mm-dd h:mm:ss'})
+    for title, header, rows in sheets:
+        ws = wb.add_worksheet(title)
+        ws.write_row(0, 0, header)
+        for row_num, row in enumerate(rows, start=1):
+            ws.write_row(row_num, 0, row)
+    wb.close()
+
+# Excel backends accepted by CASParser.to_excel
+EXCEL_ENGINES = {
+    "openpyxl": _save_openpyxl,
+    "xlsxwriter": _save_xlsxwriter,
+    "xml": xlsx_writer.save,
+}
+
+# Above this many transactions the default export writes the sheet XML directly
+_XML_EXPORT_MIN_ROWS = 5000
+
 
 class CASParser:
-    def __init__(self, pdf_path: str, password: str):
-        self.pdf_path = pdf_path
+    def __init__(self, source: Union[str, bytes, BinaryIO, None], password: str, filename: Optional[str] = None,
+                 page_texts: Optional[List[str]] = None, page_workers: int = 1):
+        # source is a path, the raw PDF bytes, or a binary file object.
+        # page_texts, when given, is text extracted from the same file earlier and skips opening it.
+        # page_workers > 1 splits text extraction of long statements across that many processes.
+        self.source = source
         self.password = password
-        self.text = self._extract_text()
-        self.cas_data = CASData()
+        self.page_workers = page_workers
+        # CAMS encode the CAS ID and generation time in the original file name
+        if filename is None:
+            filename = os.path.basename(source) if isinstance(source, str) else ""
+        self.filename = filename
+        self._pdf = self._open_pdf() if page_texts is None else None
+        # (start, end) offsets of each page within self.text
+        self._page_spans: List[Tuple[int, int]] = []
+        self.text = self._extract_text(page_texts)
+        self._reset()
 
-    def _extract_text(self) -> str:
+    def __enter__(self) -> "CASParser":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __del__(self) -> None:
+        self.close()
+
+    @property
+    def page_texts(self) -> List[str]:
+        """Plain text of each page, in page order"""
+        return [self.text[start:end] for start, end in self._page_spans]
+
+    def close(self) -> None:
+        """Release the underlying PDF document"""
+        pdf = getattr(self, '_pdf', None)
+        if pdf is not None:
+            pdf.close()
+            self._pdf = None
+            self._pdf_source = None
+
+    def _open_pdf(self) -> fitz.Document:
+        """Open the PDF once and authenticate it with the password"""
+        try:
+            if isinstance(self.source, str):
+                doc = fitz.open(self.source)
+                self._pdf_source = self.source
+            else:
+                data = self.source if isinstance(self.source, (bytes, bytearray)) else self.source.read()
+                doc = fitz.open(stream=data, filetype="pdf")
+                # Kept so page-range workers can reopen the document without the file object
+                self._pdf_source = data
+        except Exception as e:
+            raise ValueError(f"Error processing PDF: {str(e)}")
+
+        if doc.needs_pass and not doc.authenticate(self.password):
+            doc.close()
+            raise ValueError("Invalid PAN number. For CAMS CAS, use your PAN number as the password.")
+        return doc
+
+    def _extract_pages_parallel(self) -> List[str]:
+        """Extract page text in contiguous page ranges, one range per worker process"""
+        page_count = self._pdf.page_count
+        step = -(-page_count // self.page_workers)
+        starts = range(0, page_count, step)
+        stops = [min(start + step, page_count) for start in starts]
+        # MuPDF documents cannot be pickled, so each worker opens its own copy
+        with ProcessPoolExecutor(max_workers=len(starts)) as executor:
+            chunks = executor.map(_extract_page_range, repeat(self._pdf_source), repeat(self.password), starts, stops)
+            return [text for chunk in chunks for text in chunk]
+
+    def _extract_text(self, page_texts: Optional[List[str]] = None) -> str:
         try:
-            # First verify if PDF can be opened with PyPDF2
-            with open(self.pdf_path, 'rb') as file:
-                pdf = PdfReader(file)
-                if pdf.is_encrypted:
-                    try:
-                        if not pdf.decrypt(self.password):
-                            raise ValueError("Invalid PAN number. For CAMS CAS, use your PAN number as the password.")
-                    except Exception:
+            # Extract plain text once per page; each page is released as soon as it is read
+            if page_texts is None:
+                try:
+                    if self.page_workers > 1 and self._pdf.page_count >= _PARALLEL_MIN_PAGES:
+                        page_texts = self._extract_pages_parallel()
+                    else:
+                        page_texts = [page.get_text("text") for page in self._pdf]
+                except Exception as e:
+                    if "password" in str(e).lower():
                         raise ValueError("Invalid PAN number. For CAMS CAS, use your PAN number as the password.")
+                    raise ValueError(f"Error extracting text from PDF: {str(e)}")
+                finally:
+                    # Everything needed is in memory now; free MuPDF's document caches
+                    self.close()
+            text = "\n".join(page_texts)
+            
+            # Keep page boundaries as offsets so only the joined text stays resident
+            start = 0
+            for page_text in page_texts:
+                self._page_spans.append((start, start + len(page_text)))
+                start += len(page_text) + 1
 
-            # Now extract text with pdfplumber
-            try:
-                with pdfplumber.open(self.pdf_path, password=self.password) as pdf:
-                    text = ""
-                    for page in pdf.pages:
-                        text += page.extract_text() + "\n"
-                    
-                    # Verify this is a CAMS CAS
-                    if not any(marker in text for marker in [
-                        "CAMS - Consolidated Account Statement",
-                        "Computer Age Management Services Limited",
-                        "CAMS Financial Information Services"
-                    ]):
-                        raise ValueError("This appears to be not a CAMS CAS file. Please ensure you're uploading a CAMS Consolidated Account Statement.")
-                    
-                    if not text.strip():
-                        raise ValueError("No text could be extracted from the PDF. Please ensure this is a valid CAMS CAS PDF.")
-                    return text
-            except Exception as e:
-                if "password" in str(e).lower():
-                    raise ValueError("Invalid PAN number. For CAMS CAS, use your PAN number as the password.")
-                raise ValueError(f"Error extracting text from PDF: {str(e)}")
+            # isspace() stops at the first visible character instead of copying the text like strip()
+            if not text or text.isspace():
+                raise ValueError("No text could be extracted from the PDF. Please ensure this is a valid CAMS CAS PDF.")
+            
+            # Verify this is a CAMS CAS; the markers sit in the header, so the search ends early
+            if not _CAMS_MARKER_RE.search(text):
+                raise ValueError("This appears to be not a CAMS CAS file. Please ensure you're uploading a CAMS Consolidated Account Statement.")
+            return text
         except Exception as e:
             if isinstance(e, ValueError):
                 raise e
@@ -55,79 +257,179 @@ class CASParser:
 
     def parse(self) -> CASData:
         """Parse the CAS PDF and return structured data"""
+        # Start from a clean result so repeated calls don't duplicate schemes
+        self._reset()
+        
         # Extract all components
-        self._extract_investor_info()
-        self._extract_mutual_funds()
-        self._calculate_portfolio_summary()
+        self._ensure_investor_info()
+        self._ensure_portfolio_summary()
         return self.cas_data
 
-    def to_excel(self, output_path: str) -> None:
-        """Export the parsed data to Excel format"""
-        data_dict = self.cas_data.to_dict()
+    def _reset(self) -> None:
+        """Drop any extracted data; each section is extracted again when next read"""
+        self.cas_data = CASData()
+        self._investor_info_done = False
+        self._mutual_funds_done = False
+        self._portfolio_summary_done = False
+
+    # Each section is extracted the first time it is read, so callers that need
+    # only part of the statement skip the rest; parse() extracts them all.
+    def _ensure_investor_info(self) -> None:
+        # Also picks up the statement period for meta
+        if not self._investor_info_done:
+            self._extract_investor_info()
+            self._investor_info_done = True
+
+    def _ensure_mutual_funds(self) -> None:
+        # Schemes and their transactions come from the same scan
+        if not self._mutual_funds_done:
+            self._parse_mutual_funds_into_state()
+            self._mutual_funds_done = True
+
+    def _ensure_portfolio_summary(self) -> None:
+        if not self._portfolio_summary_done:
+            self._ensure_mutual_funds()
+            self._calculate_portfolio_summary()
+            self._portfolio_summary_done = True
+
+    @property
+    def investor_info(self) -> InvestorInfo:
+        self._ensure_investor_info()
+        return self.cas_data.investor_info
+
+    @property
+    def meta(self) -> Meta:
+        self._ensure_investor_info()
+        return self.cas_data.meta
+
+    @property
+    def schemes(self) -> List[MutualFundScheme]:
+        self._ensure_mutual_funds()
+        return self.cas_data.schemes
+
+    @property
+    def transactions(self) -> List[Transaction]:
+        self._ensure_mutual_funds()
+        return self.cas_data.transactions
+
+    @property
+    def portfolio_summary(self) -> PortfolioSummary:
+        self._ensure_portfolio_summary()
+        return self.cas_data.portfolio_summary
+
+    def to_excel(self, output: Union[str, BinaryIO], engine: str = "openpyxl") -> None:
+        """Export the parsed data to Excel format, written to a path or binary buffer"""
+        if engine == "openpyxl" and len(self.transactions) > _XML_EXPORT_MIN_ROWS:
+            # openpyxl's per-cell overhead dominates on very large statements
+            engine = "xml"
+        try:
+            save = EXCEL_ENGINES[engine]
+        except KeyError:
+            raise ValueError(f"Unknown Excel engine: {engine}") from None
+        save(output, self._excel_sheets())
+
+    def _excel_sheets(self) -> Iterable[ExcelSheet]:
+        """Yield each sheet of the Excel export in order"""
+        investor = self.investor_info
+        yield ('Investor Info',
+               ['Name', 'Email', 'Mobile', 'PAN', 'Address', 'CAS ID'],
+               [(investor.name, investor.email, investor.mobile, investor.pan, investor.address, investor.cas_id)])
         
-        # Create Excel writer
-        with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-            # Write each sheet
-            pd.DataFrame(data_dict['investor_info']).to_excel(writer, sheet_name='Investor Info', index=False)
-            pd.DataFrame(data_dict['portfolio_summary']).to_excel(writer, sheet_name='Portfolio Summary', index=False)
-            pd.DataFrame(data_dict['schemes']).to_excel(writer, sheet_name='MF Schemes', index=False)
-            pd.DataFrame(data_dict['transactions']).to_excel(writer, sheet_name='MF Transactions', index=False)
+        summary = self.portfolio_summary
+        yield ('Portfolio Summary',
+               ['Total Value', 'Mutual Fund Schemes', 'Mutual Fund Value'],
+               [(summary.total_value, summary.mutual_funds.count, summary.mutual_funds.total_value)])
+        
+        yield ('MF Schemes',
+               ['Folio', 'AMC', 'Scheme', 'ISIN', 'Units', 'NAV', 'Value', 'Cost',
+                'Gain', 'Gain %', 'Advisor', 'RTA', 'RTA Code'],
+               ((scheme.folio_number, scheme.amc, scheme.name, scheme.isin,
+                 scheme.units, scheme.nav, scheme.value, scheme.cost,
+                 scheme.gain.absolute, scheme.gain.percentage,
+                 scheme.additional_info.advisor, scheme.additional_info.rta, scheme.additional_info.rta_code)
+                for scheme in self.schemes))
+        
+        yield ('MF Transactions',
+               ['Folio', 'AMC', 'Scheme', 'Date', 'Description', 'Type',
+                'Amount', 'Units', 'NAV', 'Dividend Rate'],
+               ((txn.folio_number, txn.amc, txn.scheme_name, txn.date, txn.description, txn.type,
+                 txn.amount, txn.units, txn.nav, txn.dividend_rate)
+                for txn in self.transactions))
 
     def _extract_investor_info(self) -> None:
-        """Extract investor information from the CAS PDF"""
-        # Extract PAN
-        pan_pattern = r"PAN:\s*([A-Z]{5}\d{4}[A-Z])"
-        if pan_match := re.search(pan_pattern, self.text):
-            print(f"Found PAN: {pan_match.group(1)}")
-
-        # Extract name - look for lines with PAN
-        name_pattern = r"^([^\n]+)\s+PAN:"
-        if name_match := re.search(name_pattern, self.text, re.MULTILINE):
-            self.cas_data.investor_info.name = name_match.group(1).strip()
-            print(f"Found name: {self.cas_data.investor_info.name}")
-
-        # Extract email and mobile
-        email_pattern = r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b"
-        if email_match := re.search(email_pattern, self.text):
-            self.cas_data.investor_info.email = email_match.group(0)
-            print(f"Found email: {self.cas_data.investor_info.email}")
-
-        mobile_pattern = r"Mobile:\s*(\+?\d[\d\s-]{8,}\d)"
-        if mobile_match := re.search(mobile_pattern, self.text):
-            self.cas_data.investor_info.mobile = mobile_match.group(1).strip()
-            print(f"Found mobile: {self.cas_data.investor_info.mobile}")
+        """Extract investor information and the statement period from the CAS PDF"""
+        text = self.text
+        investor = self.cas_data.investor_info
+        meta = self.cas_data.meta
+        meta.cas_type = "CAMS"
+        
+        # One pass over the text for PAN, email, mobile and statement period
+        for m in _INVESTOR_META_RE.finditer(text):
+            kind = m.lastgroup
+            
+            if kind == 'pan':
+                if not investor.pan and m.group('pan_no'):
+                    investor.pan = m.group('pan_no')
+                    logger.debug("Found PAN: %s", investor.pan)
+                
+                # Extract name - the text before PAN on this line or the line above
+                if not investor.name:
+                    line_start = text.rfind('\n', 0, m.start()) + 1
+                    window_start = text.rfind('\n', 0, line_start - 1) + 1 if line_start else 0
+                    if name_match := _NAME_RE.search(text, window_start, m.start() + 4):
+                        investor.name = name_match.group(1).strip()
+                        logger.debug("Found name: %s", investor.name)
+            
+            elif kind == 'email':
+                if not investor.email:
+                    investor.email = m.group('email')
+                    logger.debug("Found email: %s", investor.email)
+            
+            elif kind == 'mobile':
+                if not investor.mobile:
+                    investor.mobile = m.group('mobile_no').strip()
+                    logger.debug("Found mobile: %s", investor.mobile)
+            
+            elif kind == 'period':
+                if not meta.statement_period:
+                    from_date = _parse_date(m.group('period_from')).date().isoformat()
+                    to_date = _parse_date(m.group('period_to')).date().isoformat()
+                    meta.period_from, meta.period_to = from_date, to_date
+                    meta.statement_period = f"{from_date} to {to_date}"
+            
+            if investor.pan and investor.name and investor.email and investor.mobile and meta.statement_period:
+                break
 
         # For CAMS, CAS ID is in the filename
-        cas_id_pattern = r"CP(\d+)_"
-        if cas_id_match := re.search(cas_id_pattern, self.pdf_path):
+        if cas_id_match := _CAS_ID_RE.search(self.filename):
             self.cas_data.investor_info.cas_id = cas_id_match.group(1)
-            print(f"Found CAS ID: {self.cas_data.investor_info.cas_id}")
+            logger.debug("Found CAS ID: %s", self.cas_data.investor_info.cas_id)
 
         # Extract address - look for lines between name and first folio
-        if self.cas_data.investor_info.name:
-            lines = self.text.split('\n')
-            for i, line in enumerate(lines):
-                if line.strip() == self.cas_data.investor_info.name:
-                    address_lines = []
-                    j = i + 1
-                    while j < len(lines) and not lines[j].strip().startswith('Folio No:'):
-                        line = lines[j].strip()
-                        if line and not line.startswith('***') and not line.startswith('Opening Unit'):
-                            address_lines.append(line)
-                        j += 1
-                    if address_lines:
-                        address = ' '.join(address_lines)
-                        # Clean up address
-                        address = re.sub(r'\s*-\s*ISIN:.*$', '', address)
-                        address = re.sub(r'\s*-\s*Growth.*$', '', address)
-                        address = re.sub(r'\s+', ' ', address)
-                        self.cas_data.investor_info.address = address.strip(' ,-')
-                        print(f"Found address: {self.cas_data.investor_info.address}")
-                        break
+        if name := self.cas_data.investor_info.name:
+            text = self.text
+            pos = 0
+            while (pos := text.find(name, pos)) != -1:
+                line_start = text.rfind('\n', 0, pos) + 1
+                line_end = text.find('\n', pos)
+                if line_end == -1:
+                    break
+                pos = line_end
+                if text[line_start:line_end].strip() != name:
+                    continue
+                address = _ADDRESS_SKIP_RE.sub('', _ADDRESS_BLOCK_RE.match(text, line_end + 1).group(1))
+                address = _WHITESPACE_RE.sub(' ', address).strip()
+                if address:
+                    # Clean up address
+                    address = _ADDRESS_ISIN_RE.sub('', address)
+                    address = _ADDRESS_GROWTH_RE.sub('', address)
+                    self.cas_data.investor_info.address = address.strip(' ,-')
+                    logger.debug("Found address: %s", self.cas_data.investor_info.address)
+                    break
 
-    def _extract_mutual_funds(self) -> None:
-        """Extract mutual fund information from text"""
-        lines = self.text.split('\n')
+    def _parse_mutual_funds_into_state(self) -> None:
+        """Extract mutual fund schemes and transactions from self.text into self.cas_data"""
+        text = self.text
         
         current_folio = None
         current_amc = None
@@ -135,38 +437,55 @@ class CASParser:
         current_advisor = None
         current_rta = None
         current_rta_code = None
+        scheme_name = None
+        state = _SEEKING_SCHEME
+        # Running mutual fund total, so the summary needs no second pass over the schemes
+        mf_summary = self.cas_data.portfolio_summary.mutual_funds
         
-        for i, line in enumerate(lines):
-            # Look for folio number lines
-            if folio_match := re.search(r'Folio No:\s*([\w\s/-]+)', line):
-                current_folio = folio_match.group(1).strip()
+        # Walk every folio/advisor/scheme/balance/transaction marker in document order
+        for m in _MASTER_RE.finditer(text):
+            kind = m.lastgroup
+            
+            if kind == 'folio':
+                # A new folio closes the previous scheme until its first ISIN line
+                state = _SEEKING_SCHEME
+                current_scheme = None
+                current_folio = m.group('folio_no').strip()
                 # Try to extract AMC from the next few lines
-                for j in range(i+1, min(i+5, len(lines))):
-                    if 'Mutual Fund' in lines[j]:
-                        current_amc = lines[j].strip()
+                for line in _following_lines(text, m.end(), 4):
+                    if 'Mutual Fund' in line:
+                        current_amc = line.strip()
                         break
-                print(f"\nFound folio: {current_folio} ({current_amc})")
-                continue
+                logger.debug("Found folio: %s (%s)", current_folio, current_amc)
             
-            # Look for advisor info
-            if advisor_match := re.search(r'ARN-([\d]+)', line):
-                current_advisor = f"ARN-{advisor_match.group(1)}"
-                print(f"Found advisor: {current_advisor}")
+            elif kind == 'arn':
+                current_advisor = m.group('arn')
+                logger.debug("Found advisor: %s", current_advisor)
             
-            # Look for RTA info
-            if 'CAMS' in line:
-                current_rta = 'CAMS'
-            elif 'KFINTECH' in line:
-                current_rta = 'KFINTECH'
+            elif kind == 'rta':
+                current_rta = m.group('rta')
             
-            # Look for ISIN lines to identify schemes
-            if isin_match := re.search(r'ISIN:\s*(INF\w+)', line):
-                isin = isin_match.group(1)
+            elif kind == 'isin':
+                isin = m.group('isin_code')
                 # Get scheme name from previous line
-                scheme_name = lines[i-1].strip() if i > 0 else ""
-                
-                # Create a new scheme
-                scheme = MutualFundScheme(
+                line_start = text.rfind('\n', 0, m.start()) + 1
+                if line_start > 0:
+                    prev_start = text.rfind('\n', 0, line_start - 1) + 1
+                    scheme_name = text[prev_start:line_start - 1].strip()
+                else:
+                    scheme_name = ""
+
+                # The advisor and registrar follow the ISIN on the same line; pick them up first
+                line_end = text.find('\n', m.end())
+                for rest in _MASTER_RE.finditer(text, m.end(), line_end if line_end != -1 else len(text)):
+                    if rest.lastgroup == 'arn':
+                        current_advisor = rest.group('arn')
+                    elif rest.lastgroup == 'rta':
+                        current_rta = rest.group('rta')
+
+                # Create a new scheme; it is added once its closing balance is seen
+                state = _IN_SCHEME
+                current_scheme = MutualFundScheme(
                     folio_number=current_folio,
                     amc=current_amc,
                     name=scheme_name,
@@ -174,116 +493,99 @@ class CASParser:
                 )
                 
                 # Set additional info
-                scheme.additional_info.advisor = current_advisor
-                scheme.additional_info.rta = current_rta
-                scheme.additional_info.rta_code = current_rta_code
-                
-                print(f"Found scheme: {scheme_name}")
-                print(f"ISIN: {isin}")
+                current_scheme.additional_info.advisor = current_advisor
+                current_scheme.additional_info.rta = current_rta
+                current_scheme.additional_info.rta_code = current_rta_code
                 
-                # Look ahead for closing balance line
-                for j in range(i+1, min(i+10, len(lines))):
-                    if 'Closing Unit Balance:' in lines[j]:
-                        # Extract units, nav, cost and value
-                        balance_line = lines[j]
-                        print(f"Balance line: {balance_line}")
-                        
-                        # Extract numbers from the line
-                        numbers = re.findall(r'[\d,]+\.?\d*', balance_line)
-                        if len(numbers) >= 3:
-                            scheme.units = float(numbers[0].replace(',', ''))
-                            scheme.nav = float(numbers[1].replace(',', ''))
-                            scheme.value = float(numbers[2].replace(',', ''))
-                            
-                            # Calculate cost and gain
-                            if cost_match := re.search(r'Cost:\s*Rs\.\s*([\d,]+\.?\d*)', balance_line):
-                                scheme.cost = float(cost_match.group(1).replace(',', ''))
-                                if scheme.cost > 0:
-                                    scheme.gain.absolute = scheme.value - scheme.cost
-                                    scheme.gain.percentage = (scheme.gain.absolute / scheme.cost) * 100
-                            
-                            print(f"Units: {scheme.units}")
-                            print(f"NAV: {scheme.nav}")
-                            print(f"Value: {scheme.value}")
-                            
-                            # Add scheme to the list
-                            self.cas_data.schemes.append(scheme)
-                            break
+                logger.debug("Found scheme: %s (ISIN: %s)", scheme_name, isin)
+            
+            elif kind == 'bal':
+                if current_scheme is None:
+                    continue
+                scheme = current_scheme
+                # Extract units, nav, cost and value
+                balance_line = m.group('bal')
+                logger.debug("Balance line: %s", balance_line)
                 
-                # Look for transactions
-                in_transactions = False
-                for j in range(i+1, len(lines)):
-                    line = lines[j].strip()
+                # Pick every labelled amount off the line in one scan
+                amounts = {}
+                for field_match in _BALANCE_FIELD_RE.finditer(balance_line):
+                    amounts[field_match.group('label')[:4]] = field_match.group('amount')
+                if 'Clos' in amounts and 'NAV' in amounts and 'Valu' in amounts:
+                    scheme.units = float(amounts['Clos'].replace(',', ''))
+                    scheme.nav = float(amounts['NAV'].replace(',', ''))
+                    scheme.value = float(amounts['Valu'].replace(',', ''))
                     
-                    # Stop if we hit the next scheme
-                    if 'ISIN:' in line:
-                        break
+                    # Calculate cost and gain
+                    if 'Cost' in amounts:
+                        scheme.cost = float(amounts['Cost'].replace(',', ''))
+                        if scheme.cost > 0:
+                            scheme.gain.absolute = scheme.value - scheme.cost
+                            scheme.gain.percentage = (scheme.gain.absolute / scheme.cost) * 100
                     
-                    # Look for transaction lines
-                    if re.match(r'\d{2}-[A-Za-z]{3}-\d{4}', line):
-                        # Parse transaction
-                        parts = line.split()
-                        if len(parts) >= 5:
-                            date = datetime.strptime(parts[0], '%d-%b-%Y')
-                            desc = ' '.join(parts[1:-3])
-                            
-                            try:
-                                amount = float(parts[-3].replace(',', ''))
-                                units = float(parts[-2].replace(',', ''))
-                                nav = float(parts[-1].replace(',', ''))
-                                
-                                txn = Transaction(
-                                    folio_number=current_folio,
-                                    amc=current_amc,
-                                    scheme_name=scheme_name,
-                                    date=date,
-                                    description=desc,
-                                    amount=amount,
-                                    units=units,
-                                    nav=nav
-                                )
-                                
-                                # Determine transaction type
-                                if 'Purchase' in desc:
-                                    txn.type = 'PURCHASE_SIP' if 'SIP' in desc else 'PURCHASE'
-                                elif 'Redemption' in desc:
-                                    txn.type = 'REDEMPTION'
-                                elif 'Switch Out' in desc:
-                                    txn.type = 'SWITCH_OUT'
-                                elif 'Switch In' in desc:
-                                    txn.type = 'SWITCH_IN'
-                                elif 'Dividend' in desc:
-                                    txn.type = 'DIVIDEND_PAYOUT' if 'Payout' in desc else 'DIVIDEND_REINVESTMENT'
-                                    if dividend_match := re.search(r'@\s*Rs\.\s*([\d.]+)', desc):
-                                        txn.dividend_rate = float(dividend_match.group(1))
-                                else:
-                                    txn.type = 'MISC'
-                                
-                                self.cas_data.transactions.append(txn)
-                            except (ValueError, IndexError):
-                                print(f"Failed to parse transaction: {line}")
-                                continue
+                    logger.debug("Units: %s, NAV: %s, Value: %s", scheme.units, scheme.nav, scheme.value)
+                    
+                    # Add scheme to the list
+                    self.cas_data.schemes.append(scheme)
+                    mf_summary.count += 1
+                    mf_summary.total_value += scheme.value
+                    current_scheme = None
+            
+            elif kind == 'txn':
+                # Transactions belong to the most recent scheme of the current folio
+                if state != _IN_SCHEME:
+                    continue
+                line = m.group('txn').strip()
+                
+                # The numeric columns are validated by the pattern, so float() cannot fail
+                txn_match = _TXN_RE.fullmatch(line)
+                if txn_match is None:
+                    logger.debug("Failed to parse transaction: %s", line)
+                    continue
+                desc = ' '.join(txn_match.group('desc').split())
+                txn = Transaction(
+                    folio_number=current_folio,
+                    amc=current_amc,
+                    scheme_name=scheme_name,
+                    date=_parse_date(txn_match.group('date')),
+                    description=desc,
+                    amount=float(txn_match.group('amount').replace(',', '')),
+                    units=float(txn_match.group('units').replace(',', '')),
+                    nav=float(txn_match.group('nav').replace(',', ''))
+                )
+                
+                # Determine transaction type
+                if 'Purchase' in desc:
+                    txn.type = 'PURCHASE_SIP' if 'SIP' in desc else 'PURCHASE'
+                elif 'Redemption' in desc:
+                    txn.type = 'REDEMPTION'
+                elif 'Switch Out' in desc:
+                    txn.type = 'SWITCH_OUT'
+                elif 'Switch In' in desc:
+                    txn.type = 'SWITCH_IN'
+                elif 'Dividend' in desc:
+                    txn.type = 'DIVIDEND_PAYOUT' if 'Payout' in desc else 'DIVIDEND_REINVESTMENT'
+                    if dividend_match := _DIVIDEND_RE.search(desc):
+                        txn.dividend_rate = float(dividend_match.group(1))
+                else:
+                    txn.type = 'MISC'
+                
+                self.cas_data.transactions.append(txn)
 
     def _calculate_portfolio_summary(self) -> None:
         """Calculate portfolio summary from extracted data"""
-        # Initialize counters
-        mf_count = len(self.cas_data.schemes)
-        mf_value = sum(scheme.value for scheme in self.cas_data.schemes if scheme.value is not None)
-        
-        # Update portfolio summary
-        self.cas_data.portfolio_summary.mutual_funds.count = float(mf_count)
-        self.cas_data.portfolio_summary.mutual_funds.total_value = mf_value
+        # Mutual fund count and value are accumulated while the schemes are extracted
+        mf_summary = self.cas_data.portfolio_summary.mutual_funds
         
         # Set total value (currently only mutual funds)
-        self.cas_data.portfolio_summary.total_value = mf_value
+        self.cas_data.portfolio_summary.total_value = mf_summary.total_value
         
-        print(f"\nPortfolio Summary:")
-        print(f"Mutual Funds: {mf_count} schemes, Total Value: Rs. {mf_value:,.2f}")
-        print(f"Total Portfolio Value: Rs. {mf_value:,.2f}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Portfolio Summary: Mutual Funds: {mf_summary.count:.0f} schemes, Total Value: Rs. {mf_summary.total_value:,.2f}")
+            logger.debug(f"Total Portfolio Value: Rs. {mf_summary.total_value:,.2f}")
 
-    def _extract_meta_info(self, text: str) -> Dict[str, Any]:
-        """Extract meta information from text"""
-        import re
+    def _extract_meta_info(self) -> Dict[str, Any]:
+        """Extract meta information from the parsed statement and the file name"""
         meta = {
             "cas_type": "CAMS",  # This is a CAMS CAS
             "generated_at": None,
@@ -293,20 +595,15 @@ class CASParser:
             }
         }
         
-        # Extract statement period from header
-        period_pattern = r"Statement for the period from (\d{2}-[A-Za-z]{3}-\d{4}) to (\d{2}-[A-Za-z]{3}-\d{4})"
-        if period_match := re.search(period_pattern, text):
-            # Convert dates from DD-MMM-YYYY to YYYY-MM-DD
-            from_date = datetime.strptime(period_match.group(1), "%d-%b-%Y").strftime("%Y-%m-%d")
-            to_date = datetime.strptime(period_match.group(2), "%d-%b-%Y").strftime("%Y-%m-%d")
-            meta["statement_period"]["from"] = from_date
-            meta["statement_period"]["to"] = to_date
+        # The statement period is read from the header by the investor details pass
+        statement = self.meta
+        meta["statement_period"]["from"] = statement.period_from or None
+        meta["statement_period"]["to"] = statement.period_to or None
         
         # Extract generated_at from filename
         # Format: CAS_01012004-21062025_CP188509986_21062025053730617.pdf
         # Last part is YYYYMMDDHHmmSSsss
-        generated_pattern = r"_(\d{14}\d*)\."
-        if generated_match := re.search(generated_pattern, self.pdf_path):
+        if generated_match := _GENERATED_RE.search(self.filename):
             timestamp = generated_match.group(1)
             # Convert to ISO format
             year = timestamp[0:4]
@@ -328,55 +625,29 @@ class CASParser:
         }
         
         try:
-            # Open PDF file
-            pdf = pdfplumber.open(self.pdf_path, password=self.password)
-            
-            # Initialize text
-            all_text = ""
-            
-            # Iterate over pages
-            for page_num, page in enumerate(pdf.pages, start=1):
-                text = page.extract_text()
-                if text:
-                    print(f"\nPage {page_num} content:")
-                    print("-" * 20)
-                    print(text)
-                    print("-" * 20)
-                    all_text += text + "\n"
-            
-            # Initialize lists for collecting data
-            mutual_funds = []
+            # Investor details and mutual funds come from the regular parse of self.text
+            self.parse()
             
             # Extract meta information
-            result["meta"] = self._extract_meta_info(all_text)
+            result["meta"] = self._extract_meta_info()
             
             # Extract investor information
-            result["investor"] = self._extract_investor_info(all_text)
+            result["investor"] = asdict(self.cas_data.investor_info)
             
-            # Extract tables for mutual funds and demat holdings
-            print("\nProcessing text for holdings...")
-            for page in pdf.pages:
-                text = page.extract_text()
-                print(f"Processing page {page.page_number}")
-                
-                # Look for mutual fund sections
-                if 'Mutual Fund Folios' in text:
-                    print("\nFound mutual fund section:")
-                    print("Raw text:")
-                    print(text)
-                    
-                    # Extract mutual funds
-                    funds = self._extract_mutual_funds(text)
-                    mutual_funds.extend(funds)
+            # Extract tables for demat holdings
+            logger.debug("Processing text for holdings...")
+            for page_num, (start, end) in enumerate(self._page_spans, start=1):
+                text = self.text[start:end]
+                logger.debug("Processing page %s", page_num)
                 
                 # Look for demat sections
                 if 'Demat Holdings' in text:
-                    print("Found demat section")
-                    lines = text.split('\n')
+                    logger.debug("Found demat section")
                     in_table = False
                     
-                    for line in lines:
-                        line = line.strip()
+                    # Walk line spans in place rather than splitting the page into a list
+                    for line_match in _LINE_RE.finditer(text):
+                        line = line_match.group().strip()
                         if not line:
                             continue
                             
@@ -401,18 +672,18 @@ class CASParser:
                                         "current_price": float(parts[-2].replace(',', '')) if len(parts) > 2 else 0.0,
                                         "current_value": float(parts[-1].replace(',', '')) if len(parts) > 1 else 0.0
                                     }
-                                    print(f"Found holding: {holding['security_name']}")
+                                    logger.debug("Found holding: %s", holding['security_name'])
                                     result["demat_accounts"].append(holding)
                                 except (ValueError, IndexError) as e:
-                                    print(f"Error parsing holding line: {e}")
+                                    logger.debug("Error parsing holding line: %s", e)
             
-            # Assign collected mutual funds to result
-            result["mutual_funds"] = mutual_funds
+            # Assign parsed mutual fund schemes to result
+            result["mutual_funds"] = [asdict(scheme) for scheme in self.cas_data.schemes]
             
             return result
             
         except Exception as e:
-            print(f"Error occurred: {str(e)}")
+            logger.warning("Error occurred: %s", e)
             return {"error": str(e)}
 
     def save_to_json(self, output_path: str) -> None:
@@ -0,0 +1,121 @@
+import io
+import unittest
+from datetime import datetime
+
+import openpyxl
+
+import xlsx_writer
+from pdf_parser import CASParser
+
+FILENAME = "CAS_01012004-21062025_CP188509986_21062025053730617.pdf"
+
+STATEMENT = """\
+CAMS - Consolidated Account Statement
+Statement for the period from 01-Jan-2020 to 21-Jun-2025
+Email Id: jane.doe@example.com
+JANE DOE PAN: ABCDE1234F
+JANE DOE
+12 MG Road, Indiranagar
+Bengaluru 560038
+Mobile: +91 9876543210
+Folio No: 1234567 / 89
+Axis Mutual Fund
+Axis Bluechip Fund - Direct Growth
+ISIN: INF846K01164(Advisor: ARN-11111) Registrar : CAMS
+Opening Unit Balance: 0.000
+01-Feb-2024 Purchase - SIP 1,000.00 10.000 100.00
+15-Mar-2024 Redemption -500.00 -4.000 125.00
+Closing Unit Balance: 6.000 NAV on 20-Jun-2025: INR 150.00 Total Cost Value: 600.00 Market Value on 20-Jun-2025: INR 900.00
+Folio No: 555
+HDFC Mutual Fund
+05-Apr-2024 Stamp duty 0.05 0.000 0.00
+HDFC Top 100 Fund - Growth
+ISIN: INF179K01BB8(Advisor: ARN-22222) Registrar : KFINTECH
+10-Apr-2024 Purchase 2,000.00 20.000 100.00
+Closing Unit Balance: 20.000 NAV on 20-Jun-2025: INR 110.00 Total Cost Value: 2,000.00 Market Value on 20-Jun-2025: INR 2,200.00
+"""
+
+
+def _parser(text: str = STATEMENT) -> CASParser:
+    return CASParser(None, "ABCDE1234F", filename=FILENAME, page_texts=[text])
+
+
+class MutualFundScanTest(unittest.TestCase):
+    def setUp(self):
+        self.parser = _parser()
+        self.parser._parse_mutual_funds_into_state()
+        self.schemes = self.parser.cas_data.schemes
+        self.transactions = self.parser.cas_data.transactions
+
+    def test_schemes_closed_at_balance(self):
+        self.assertEqual([s.isin for s in self.schemes], ["INF846K01164", "INF179K01BB8"])
+        first = self.schemes[0]
+        self.assertEqual(first.folio_number, "1234567 / 89")
+        self.assertEqual(first.amc, "Axis Mutual Fund")
+        self.assertEqual(first.name, "Axis Bluechip Fund - Direct Growth")
+        self.assertEqual((first.units, first.nav, first.value, first.cost), (6.0, 150.0, 900.0, 600.0))
+        self.assertAlmostEqual(first.gain.absolute, 300.0)
+        self.assertAlmostEqual(first.gain.percentage, 50.0)
+
+    def test_advisor_and_rta_from_isin_line(self):
+        info = [(s.additional_info.advisor, s.additional_info.rta) for s in self.schemes]
+        self.assertEqual(info, [("ARN-11111", "CAMS"), ("ARN-22222", "KFINTECH")])
+
+    def test_transactions(self):
+        txn = self.transactions[0]
+        self.assertEqual(txn.scheme_name, "Axis Bluechip Fund - Direct Growth")
+        self.assertEqual(txn.date, datetime(2024, 2, 1))
+        self.assertEqual((txn.amount, txn.units, txn.nav), (1000.0, 10.0, 100.0))
+        self.assertEqual([t.type for t in self.transactions], ["PURCHASE_SIP", "REDEMPTION", "PURCHASE"])
+
+    def test_transaction_before_first_isin_of_folio_is_skipped(self):
+        self.assertNotIn("Stamp duty", [t.description for t in self.transactions])
+        self.assertEqual([t.folio_number for t in self.transactions], ["1234567 / 89", "1234567 / 89", "555"])
+
+    def test_summary_accumulated(self):
+        mf_summary = self.parser.cas_data.portfolio_summary.mutual_funds
+        self.assertEqual(mf_summary.count, 2)
+        self.assertAlmostEqual(mf_summary.total_value, 3100.0)
+
+
+class InvestorInfoTest(unittest.TestCase):
+    def test_investor_details(self):
+        parser = _parser()
+        parser._extract_investor_info()
+        investor = parser.cas_data.investor_info
+        self.assertEqual(investor.name, "JANE DOE")
+        self.assertEqual(investor.pan, "ABCDE1234F")
+        self.assertEqual(investor.email, "jane.doe@example.com")
+        self.assertEqual(investor.mobile, "+91 9876543210")
+        self.assertEqual(investor.cas_id, "188509986")
+        self.assertEqual(investor.address, "12 MG Road, Indiranagar Bengaluru 560038 Mobile: +91 9876543210")
+
+    def test_statement_period(self):
+        parser = _parser()
+        parser._extract_investor_info()
+        meta = parser.cas_data.meta
+        self.assertEqual(meta.statement_period, "2020-01-01 to 2025-06-21")
+        self.assertEqual((meta.period_from, meta.period_to), ("2020-01-01", "2025-06-21"))
+
+
+class XlsxWriterTest(unittest.TestCase):
+    def test_round_trip_through_openpyxl(self):
+        rows = [
+            ("1234567 / 89", "Axis <Bluechip> & Co", datetime(2024, 2, 1), 1000.5, 10),
+            ("1234567 / 89", "Axis <Bluechip> & Co", datetime(2024, 3, 15), -500.0, None),
+        ]
+        buffer = io.BytesIO()
+        xlsx_writer.save(buffer, [
+            ("Info", ["Name"], [("JANE DOE",)]),
+            ("MF Transactions", ["Folio", "Scheme", "Date", "Amount", "Units"], iter(rows)),
+        ])
+        buffer.seek(0)
+        wb = openpyxl.load_workbook(buffer)
+        self.assertEqual(wb.sheetnames, ["Info", "MF Transactions"])
+        self.assertEqual(wb["Info"]["A2"].value, "JANE DOE")
+        values = list(wb["MF Transactions"].iter_rows(values_only=True))
+        self.assertEqual(values, [("Folio", "Scheme", "Date", "Amount", "Units")] + rows)
+
+
+if __name__ == "__main__":
+    unittest.main()
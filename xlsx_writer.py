@@ -0,0 +1,174 @@
+"""Minimal xlsx writer that emits worksheet XML directly.
+
+Used for large exports, where creating an openpyxl cell object for every
+value dominates export time. Only what the CAS export needs is supported:
+strings, numbers and datetimes, with no styling beyond a date format.
+Strings go through a shared strings table, so the folio, scheme and ISIN
+values repeated on every transaction row are stored once.
+"""
+import io
+import re
+import zipfile
+from datetime import datetime
+from itertools import chain
+from typing import BinaryIO, Dict, Iterable, List, Tuple, Union
+from xml.sax.saxutils import escape, quoteattr
+
+# Characters XML 1.0 does not allow; PDF text occasionally carries them
+_INVALID_XML_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '<Override PartName="/xl/sharedStrings.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+    '{sheets}'
+    '</Types>'
+)
+_CONTENT_TYPE_SHEET = (
+    '<Override PartName="/xl/worksheets/sheet{n}.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+)
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets>{sheets}</sheets>'
+    '</workbook>'
+)
+_WORKBOOK_SHEET = '<sheet name={name} sheetId="{n}" r:id="rId{n}"/>'
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '{sheets}'
+    '<Relationship Id="rId{styles}" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '<Relationship Id="rId{strings}" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" '
+    'Target="sharedStrings.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK_RELS_SHEET = (
+    '<Relationship Id="rId{n}" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet{n}.xml"/>'
+)
+
+# Style 0 is the default; style 1 applies the built-in date-time format (numFmtId 22)
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_TAIL = '</sheetData></worksheet>'
+
+_SHARED_STRINGS_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" uniqueCount="{unique}">'
+)
+_SHARED_STRINGS_TAIL = '</sst>'
+
+
+def _column_letter(index: int) -> str:
+    """Spreadsheet column name for a zero-based column index"""
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _cell(ref: str, value, strings: Dict[str, int]) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{ref}"><v>{value!r}</v></c>'
+    if isinstance(value, datetime):
+        serial = (value - _EXCEL_EPOCH).total_seconds() / 86400
+        return f'<c r="{ref}" s="1"><v>{serial!r}</v></c>'
+    text = str(value)
+    index = strings.get(text)
+    if index is None:
+        index = strings[text] = len(strings)
+    return f'<c r="{ref}" t="s"><v>{index}</v></c>'
+
+
+def _write_rows(out: io.TextIOBase, rows: Iterable[tuple], strings: Dict[str, int]) -> None:
+    columns: List[str] = []
+    for row_num, row in enumerate(rows, start=1):
+        # Column letters are computed once and reused for every row
+        while len(columns) < len(row):
+            columns.append(_column_letter(len(columns)))
+        out.write(f'<row r="{row_num}">')
+        out.write("".join(_cell(f"{col}{row_num}", value, strings) for col, value in zip(columns, row)))
+        out.write('</row>')
+
+
+def save(output: Union[str, BinaryIO], sheets: Iterable[Tuple[str, List[str], Iterable[tuple]]]) -> None:
+    """Write (title, header, rows) sheets to an xlsx file at a path or binary buffer"""
+    titles = []
+    # Each distinct string maps to its index in the shared strings table, in first-seen order
+    strings: Dict[str, int] = {}
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as zf:
+        for n, (title, header, rows) in enumerate(sheets, start=1):
+            titles.append(title)
+            # Rows are encoded straight into the archive member; the sheet is never held as one string
+            with io.TextIOWrapper(zf.open(f"xl/worksheets/sheet{n}.xml", "w"), encoding="utf-8") as out:
+                out.write(_SHEET_HEAD)
+                _write_rows(out, chain([header], rows), strings)
+                out.write(_SHEET_TAIL)
+
+        with io.TextIOWrapper(zf.open("xl/sharedStrings.xml", "w"), encoding="utf-8") as out:
+            out.write(_SHARED_STRINGS_HEAD.format(unique=len(strings)))
+            for text in strings:
+                text = escape(_INVALID_XML_RE.sub("", text))
+                out.write(f'<si><t xml:space="preserve">{text}</t></si>')
+            out.write(_SHARED_STRINGS_TAIL)
+
+        numbers = range(1, len(titles) + 1)
+        zf.writestr("[Content_Types].xml", _CONTENT_TYPES.format(
+            sheets="".join(_CONTENT_TYPE_SHEET.format(n=n) for n in numbers)))
+        zf.writestr("_rels/.rels", _ROOT_RELS)
+        zf.writestr("xl/workbook.xml", _WORKBOOK.format(
+            sheets="".join(_WORKBOOK_SHEET.format(name=quoteattr(title), n=n)
+                           for n, title in zip(numbers, titles))))
+        zf.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS.format(
+            sheets="".join(_WORKBOOK_RELS_SHEET.format(n=n) for n in numbers),
+            styles=len(titles) + 1, strings=len(titles) + 2))
+        zf.writestr("xl/styles.xml", _STYLES)